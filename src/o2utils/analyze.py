@@ -1,21 +1,12 @@
 from pathlib import Path
-from typing import NamedTuple, TypedDict, cast
+from typing import TypedDict, cast
 
 import polars as pl
 import polars.selectors as cs
-from safe_result import Err, Ok, safe
-from scipy import stats
 
-from o2utils.common import MetadataRow
+from o2utils.common import MetadataRow, read_metadata
 
-
-class LinregressResult(NamedTuple):
-    slope: float
-    intercept: float
-    rvalue: float
-    pvalue: float
-    stderr: float
-    intercept_stderr: float
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S%z"
 
 
 class FitResult(TypedDict):
@@ -28,9 +19,58 @@ class FitResult(TypedDict):
     duration: str | None
 
 
-@safe
-def _mean_value(s: pl.Series) -> float:
-    return s.mean()
+def _fit_windows(
+    windowed: pl.DataFrame, sources: list[str], x_col: str, y_col: str, y2_col: str
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    x = pl.col(x_col).cast(pl.Float64)
+    y = pl.col(y_col).cast(pl.Float64)
+
+    # closed-form least squares from per-file sums, no per-file round-trip through Python
+    sums = windowed.group_by("source_file_cleaned", maintain_order=True).agg(
+        pl.len().alias("n"),
+        x.sum().alias("sx"),
+        y.sum().alias("sy"),
+        (x * y).sum().alias("sxy"),
+        (x * x).sum().alias("sxx"),
+        (y * y).sum().alias("syy"),
+        pl.col(y2_col).mean().alias("mean_temperature"),
+        pl.col("datetime_local").first().alias("start_time"),
+        pl.col("datetime_local").last().alias("stop_time"),
+    )
+    cov_xy = pl.col("n") * pl.col("sxy") - pl.col("sx") * pl.col("sy")
+    var_x = pl.col("n") * pl.col("sxx") - pl.col("sx") ** 2
+    var_y = pl.col("n") * pl.col("syy") - pl.col("sy") ** 2
+    fits = sums.with_columns(
+        (cov_xy / var_x).alias("slope"),
+        # constant oxygen gives r = 0 like scipy.stats.linregress did, instead of 0 / 0
+        pl.when(var_y == 0).then(0.0).otherwise(cov_xy**2 / (var_x * var_y)).alias("r2"),
+    ).with_columns(((pl.col("sy") - pl.col("slope") * pl.col("sx")) / pl.col("n")).alias("intercept"))
+
+    # files without any data inside their analysis window still get a (null) result row
+    res_df = (
+        pl.DataFrame({"source_file_cleaned": sources}, schema={"source_file_cleaned": pl.Utf8})
+        .join(fits, on="source_file_cleaned", how="left", maintain_order="left")
+        .select(
+            "source_file_cleaned",
+            pl.col("slope").round(5),
+            pl.col("r2").round(3),
+            pl.col("mean_temperature").round(1),
+            pl.col("start_time", "stop_time").dt.strftime(DATETIME_FORMAT),
+            (pl.col("stop_time") - pl.col("start_time")).dt.to_string("polars").alias("duration"),
+        )
+    )
+
+    source_df = (
+        windowed.join(
+            fits.select("source_file_cleaned", "slope", "intercept"),
+            on="source_file_cleaned",
+            maintain_order="left",
+        )
+        .with_columns((pl.col("slope") * pl.col(x_col) + pl.col("intercept")).alias("oxygen_fitted"))
+        .drop("slope", "intercept")
+    )
+
+    return res_df, source_df
 
 
 def linear_fit(
@@ -41,74 +81,17 @@ def linear_fit(
     y2_col: str = "temperature",
 ) -> tuple[pl.DataFrame, pl.DataFrame]:
     name = df.item(0, "source_file_cleaned")
-    res = FitResult(
-        source_file_cleaned=name,
-        slope=None,
-        r2=None,
-        mean_temperature=None,
-        start_time=None,
-        stop_time=None,
-        duration=None,
-    )
-    schema = {
-        "source_file_cleaned": pl.Utf8,
-        "slope": pl.Float64,
-        "r2": pl.Float64,
-        "mean_temperature": pl.Float64,
-        "start_time": pl.Utf8,
-        "stop_time": pl.Utf8,
-        "duration": pl.Utf8,
-    }
 
     start = metadata["analysis_start_seconds"]
     stop = metadata["analysis_stop_seconds"]
-    if stop == -1:
-        stop = df.item(-1, x_col)
+    stop_expr = pl.col(x_col).max() if stop == -1 else pl.lit(stop)
 
-    df = df.filter(pl.col(x_col).is_between(start, stop))
+    df = df.filter(pl.col(x_col).is_between(start, stop_expr))
 
     if df.is_empty():
         print(f"no data for {name}")
-        return pl.DataFrame(res, schema=schema, strict=False), df.with_columns(
-            pl.lit(float("nan")).alias("oxygen_fitted")
-        )
-
-    result = cast(LinregressResult, stats.linregress(df.get_column(x_col), df.get_column(y_col)))
 
-    df = df.with_columns((result.slope * pl.col(x_col) + result.intercept).alias("oxygen_fitted"))
-
-    t_start = df.item(0, "datetime_local")
-    t_stop = df.item(-1, "datetime_local")
-
-    mean_res = _mean_value(df.get_column(y2_col))
-
-    match mean_res:
-        case Ok(v):
-            mean_res = v
-        case Err(e):
-            print(e)
-            mean_res = float("nan")
-        case _:
-            mean_res = float("nan")
-
-    res.update(
-        slope=result.slope,
-        r2=result.rvalue**2,
-        mean_temperature=mean_res,
-        start_time=t_start,
-        stop_time=t_stop,
-    )
-
-    res_df = pl.DataFrame(res, schema=schema, strict=False).with_columns(
-        pl.col("slope").round(5),
-        pl.col("r2").round(3),
-        pl.col("mean_temperature").round(1),
-        (pl.col("stop_time").str.to_datetime() - pl.col("start_time").str.to_datetime())
-        .dt.to_string("polars")
-        .alias("duration"),
-    )
-
-    return res_df, df
+    return _fit_windows(df, [name], x_col, y_col, y2_col)
 
 
 def get_fit(
@@ -116,12 +99,12 @@ def get_fit(
 ) -> tuple[pl.DataFrame, pl.DataFrame]:
     info = cast(
         MetadataRow,
-        pl.read_excel(info_file, sheet_name="metadata").row(
+        read_metadata(info_file).row(
             by_predicate=pl.col("source_file_cleaned") == source_file_cleaned.stem, named=True
         ),
     )
 
-    data = pl.read_csv(source_file_cleaned)
+    data = pl.scan_ipc(source_file_cleaned).collect(engine="streaming")
 
     start = start or info["analysis_start_seconds"]
     stop = stop or info["analysis_stop_seconds"]
@@ -132,28 +115,41 @@ def get_fit(
 def fit_all(
     folder: Path,
     info_file: Path,
+    x_col: str = "time_seconds",
+    y_col: str = "oxygen",
+    y2_col: str = "temperature",
 ) -> tuple[pl.DataFrame, pl.DataFrame]:
-    info_df = pl.read_excel(info_file, sheet_name="metadata")
-
-    data = pl.concat(
-        pl.read_csv(f).select(~cs.starts_with("logtime")).with_columns(pl.lit(f.stem).alias("source_file_cleaned"))
-        for f in folder.glob("*.csv")
-    ).partition_by("source_file_cleaned", include_key=True)
+    info_df = read_metadata(info_file).select("source_file_cleaned", "analysis_start_seconds", "analysis_stop_seconds")
+
+    duplicated = info_df.filter(pl.col("source_file_cleaned").is_duplicated()).get_column("source_file_cleaned")
+    if not duplicated.is_empty():
+        raise ValueError(f"duplicate metadata rows for: {', '.join(sorted(set(duplicated)))}")
+    sources = {f.stem for f in folder.glob("*.arrow")}
+    missing = sources - set(info_df.get_column("source_file_cleaned"))
+    if missing:
+        raise ValueError(f"no metadata for: {', '.join(sorted(missing))}")
+
+    data = (
+        pl.scan_ipc(folder / "*.arrow", include_file_paths="source_path")
+        .with_columns(pl.col("source_path").str.extract(r"([^/\\]+)\.arrow$").alias("source_file_cleaned"))
+        .select(~cs.starts_with("logtime", "source_path"))
+    )
 
-    res_dfs: list[pl.DataFrame] = []
-    source_dfs: list[pl.DataFrame] = []
+    stop = (
+        pl.when(pl.col("analysis_stop_seconds") == -1)
+        .then(pl.col(x_col).max().over("source_file_cleaned"))
+        .otherwise(pl.col("analysis_stop_seconds"))
+    )
 
-    for df in data:
-        source_name = df.item(0, "source_file_cleaned")
-        info = cast(
-            MetadataRow,
-            info_df.row(by_predicate=pl.col("source_file_cleaned") == source_name, named=True),
-        )
-        res_df, source_df = linear_fit(df, info)
-        res_dfs.append(res_df)
-        source_dfs.append(source_df)
+    # source_df needs every row inside the analysis windows anyway, so collect them once and fit from that frame
+    windowed = (
+        data.join(info_df.lazy(), on="source_file_cleaned", how="left", maintain_order="left")
+        .filter(pl.col(x_col).is_between(pl.col("analysis_start_seconds"), stop))
+        .drop("analysis_start_seconds", "analysis_stop_seconds")
+        .collect(engine="streaming")
+    )
 
-    return pl.concat(res_dfs), pl.concat(source_dfs)
+    return _fit_windows(windowed, sorted(sources), x_col, y_col, y2_col)
 
 
 if __name__ == "__main__":
@@ -173,4 +169,6 @@ if __name__ == "__main__":
         },
     )
     # res_df.write_csv("E:/dev-home/_readonly_datastore_/2025_HMSC/results/linear_fits.csv")
-    source_df.write_csv("E:/dev-home/_readonly_datastore_/2025_HMSC/results/linear_fits_data.csv")
+    source_df.write_csv(
+        "E:/dev-home/_readonly_datastore_/2025_HMSC/results/linear_fits_data.csv", datetime_format=DATETIME_FORMAT
+    )
@@ -1,9 +1,35 @@
-import datetime
+import functools
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import polars as pl
 import polars.selectors as cs
-from janitor.polars import clean_names
+
+_NAME_TRANSLATION = str.maketrans({c: "_" for c in " /:,?().-\xa0"} | {c: "" for c in "'’"})
+_SPECIAL_CHARS = re.compile(r"\W")
+_REPEATED_UNDERSCORES = re.compile(r"_+")
+
+
+def clean_name(name: str) -> str:
+    """
+    Convert a column name to lower snake case, dropping accents and any special characters.
+
+    Follows `janitor.polars.clean_names(remove_special=True, strip_underscores=True, strip_accents=True)`: only
+    characters for which `str.isalnum()` is true and "_" are kept, so e.g. "µ" and "²" survive.
+    """
+    name = name.lower().translate(_NAME_TRANSLATION)
+    # NFD splits accented letters into base letter + combining mark, the mark (not alphanumeric) is then dropped as a
+    # special character
+    name = _SPECIAL_CHARS.sub("", unicodedata.normalize("NFD", name))
+    return _REPEATED_UNDERSCORES.sub("_", name).strip("_")
+
+
+@functools.cache
+def _clean_names_mapping(columns: tuple[str, ...]) -> dict[str, str]:
+    # every export from the same device shares its header, so this only runs once per header variant
+    return {c: clean_name(c) for c in columns}
 
 
 def combine_to_datetime(
@@ -43,66 +69,86 @@ def combine_to_datetime(
     return out
 
 
-def parse_presens_file(
+def scan_presens_file(
     source: str | Path,
     renamed_source: str,
     separator: str = ";",
     skip_rows: int = 57,
     tz_presens: str = "Europe/Berlin",
     tz_local: str = "America/Los_Angeles",
-) -> pl.DataFrame:
+) -> pl.LazyFrame:
     """
-    Parse a presens file into a polars DataFrame.
+    Build a lazy query that parses a presens file, see `parse_presens_file`.
     """
     file_path = Path(source)
 
-    df: pl.DataFrame = clean_names(
-        pl.scan_csv(
-            file_path,
-            separator=separator,
-            skip_rows=skip_rows,
-        )
-        .select(cs.by_dtype(pl.Utf8).str.strip_chars())
-        .collect(),
-        remove_special=True,
-        strip_underscores=True,
-        strip_accents=True,
-    )
+    lf = pl.scan_csv(
+        file_path,
+        separator=separator,
+        skip_rows=skip_rows,
+    ).select(cs.by_dtype(pl.Utf8).str.strip_chars())
+    columns = _clean_names_mapping(tuple(lf.collect_schema().names()))
+    lf = lf.rename(columns)
 
-    logtime_col = df.get_column("logtime_min", default=None)
-    if logtime_col is None:
-        logtime_col = df.get_column("logtime_h").cast(pl.Float64) * 60
+    if "logtime_min" in columns.values():
+        logtime_col = pl.col("logtime_min").cast(pl.Float64)
     else:
-        logtime_col = logtime_col.cast(pl.Float64)
-
-    return df.select(
-        pl.lit(file_path.stem).alias("source_file"),
-        pl.lit(renamed_source).alias("source_file_cleaned"),
-        (
-            combine_to_datetime("date_dd_mm_yy", "time_hh_mm_ss", as_str=False)
-            - combine_to_datetime("date_dd_mm_yy", "time_hh_mm_ss", as_str=False).first()
+        logtime_col = pl.col("logtime_h").cast(pl.Float64) * 60
+
+    # parse the combined date/time strings once and derive all datetime columns from the result. `_dt` stays naive so
+    # that time_seconds is the difference in recorded wall-clock time, also across a DST change
+    return (
+        lf.with_columns(combine_to_datetime("date_dd_mm_yy", "time_hh_mm_ss", as_str=False).alias("_dt"))
+        .select(
+            pl.lit(file_path.stem).alias("source_file"),
+            pl.lit(renamed_source).alias("source_file_cleaned"),
+            (pl.col("_dt") - pl.col("_dt").first()).dt.total_seconds().cast(pl.Int32).alias("time_seconds"),
+            logtime_col.round(3).alias("logtime_min"),
+            cs.by_name("oxygen_airsatur", "temp_c", "phase").cast(pl.Float64),
+            pl.col("amp").cast(pl.Int32),
+            pl.col("_dt").dt.replace_time_zone(tz_presens).alias("datetime_presens"),
+            pl.col("_dt").dt.replace_time_zone(tz_presens).dt.convert_time_zone(tz_local).alias("datetime_local"),
+        )
+        .rename(
+            {
+                "oxygen_airsatur": "oxygen",
+                "temp_c": "temperature",
+                "phase": "phase",
+                "amp": "amplitude",
+            }
         )
-        .dt.total_seconds()
-        .cast(pl.Int32)
-        .alias("time_seconds"),
-        logtime_col.round(3).alias("logtime_min"),
-        cs.by_name("oxygen_airsatur", "temp_c", "phase").cast(pl.Float64),
-        pl.col("amp").cast(pl.Int32),
-        combine_to_datetime("date_dd_mm_yy", "time_hh_mm_ss", tz=tz_presens).alias("datetime_presens"),
-        combine_to_datetime("date_dd_mm_yy", "time_hh_mm_ss", tz=tz_presens, convert_to_tz=tz_local).alias(
-            "datetime_local"
-        ),
-    ).rename(
-        {
-            "oxygen_airsatur": "oxygen",
-            "temp_c": "temperature",
-            "phase": "phase",
-            "amp": "amplitude",
-        }
     )
 
 
-def presens_to_csv(
+def parse_presens_file(
+    source: str | Path,
+    renamed_source: str,
+    separator: str = ";",
+    skip_rows: int = 57,
+    tz_presens: str = "Europe/Berlin",
+    tz_local: str = "America/Los_Angeles",
+) -> pl.DataFrame:
+    """
+    Parse a presens file into a polars DataFrame.
+    """
+    return scan_presens_file(
+        source, renamed_source, separator=separator, skip_rows=skip_rows, tz_presens=tz_presens, tz_local=tz_local
+    ).collect()
+
+
+def _write_presens_ipc(output_folder: Path, renamed_source: str, df: pl.DataFrame) -> Path:
+    """
+    Write a parsed presens file to `output_folder`, named after its first local timestamp.
+    """
+    first_dtm = df.select(pl.col("datetime_local").first().dt.strftime("%Y%m%dT%H%M%S")).item()
+    new_with_dtm = f"{first_dtm}_{renamed_source.split('_', 1)[1]}"
+
+    out_path = Path(output_folder / new_with_dtm).with_suffix(".arrow")
+    df.write_ipc(out_path, compression="zstd")
+    return out_path
+
+
+def presens_to_arrow(
     presens_folder: Path,
     output_folder: Path,
     name_mapping: dict[str, str],
@@ -112,23 +158,24 @@ def presens_to_csv(
     tz_local: str = "America/Los_Angeles",
 ) -> None:
     """
-    Convert a folder of presens files into cleaned up csv's and standardize file names
+    Convert a folder of presens files into cleaned up Arrow IPC files and standardize file names
+
+    The files don't all share the same columns (`logtime_min` vs `logtime_h`), so instead of a single multi-file scan
+    every file gets its own lazy query and all of them are run together with `pl.collect_all`. The results are then
+    written in parallel.
     """
     renamed = {f.resolve().as_posix(): name_mapping[f.stem] for f in Path(presens_folder).glob("*.txt")}
-    renamed_with_dtm: dict[str, tuple[str, pl.DataFrame]] = {}
 
-    for old, new in renamed.items():
-        df = parse_presens_file(
-            old, new, separator=separator, skip_rows=skip_rows, tz_presens=tz_presens, tz_local=tz_local
-        )
-        first_dtm_string = df.item(0, "datetime_local")
-        first_dtm = datetime.datetime.strptime(first_dtm_string, "%Y-%m-%d %H:%M:%S%z")
-        new_with_dtm = f"{first_dtm.strftime('%Y%m%dT%H%M%S')}_{new.split('_', 1)[1]}"
-        renamed_with_dtm[old] = new_with_dtm, df
+    plans = [
+        scan_presens_file(old, new, separator=separator, skip_rows=skip_rows, tz_presens=tz_presens, tz_local=tz_local)
+        for old, new in renamed.items()
+    ]
 
-    for _, (dtm_name, df) in renamed_with_dtm.items():
-        out_path = Path(output_folder / dtm_name).with_suffix(".csv")
-        df.write_csv(out_path, datetime_format="%Y-%m-%d %H:%M:%S%z")
+    # polars releases the GIL while compressing and writing, so threads are enough to write the files in parallel
+    with ThreadPoolExecutor() as executor:
+        list(
+            executor.map(functools.partial(_write_presens_ipc, output_folder), renamed.values(), pl.collect_all(plans))
+        )
 
 
 if __name__ == "__main__":
@@ -136,4 +183,4 @@ if __name__ == "__main__":
     output_folder = Path("E:/dev-home/_readonly_datastore_/2025_HMSC/source_cleaned")
     name_mapping = pl.read_excel("E:/dev-home/_readonly_datastore_/2025_HMSC/metadata.xlsx", sheet_name="name_map")
     rename_map = {row[0]: row[1] for row in name_mapping.iter_rows()}
-    presens_to_csv(presens_folder, output_folder, rename_map)
+    presens_to_arrow(presens_folder, output_folder, rename_map)
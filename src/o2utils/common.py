@@ -1,18 +1,53 @@
 import datetime
+import functools
+from pathlib import Path
 from typing import Literal, TypedDict, cast
 
 import polars as pl
 
-METADATA = (
-    pl.read_excel("E:/dev-home/_readonly_datastore_/2025_HMSC/metadata.xlsx", sheet_name="metadata")
-    .with_columns(pl.col(pl.Float64).round(4))
-    .with_columns(
-        pl.col("fertilization_time", "start_time_newport").str.to_datetime(
-            "%Y-%m-%d %H:%M:%S", time_zone="America/Los_Angeles", strict=False
+METADATA_FILE = Path("E:/dev-home/_readonly_datastore_/2025_HMSC/metadata.xlsx")
+DATA_FILE = Path("E:/dev-home/_readonly_datastore_/2025_HMSC/intermediate_outputs/source_cleaned_combined.arrow")
+
+
+@functools.lru_cache
+def _read_metadata_sheet(path: Path, mtime_ns: int) -> pl.DataFrame:
+    cache_file = path.with_suffix(".metadata.parquet")
+    if cache_file.exists() and cache_file.stat().st_mtime_ns >= mtime_ns:
+        return pl.read_parquet(cache_file)
+
+    df = pl.read_excel(path, sheet_name="metadata")
+    try:
+        df.write_parquet(cache_file)
+    except OSError:
+        pass  # read-only location, keep working from the excel file
+    return df
+
+
+def read_metadata(path: Path = METADATA_FILE) -> pl.DataFrame:
+    """
+    Read the "metadata" sheet of `path`.
+
+    The sheet is stored as a parquet file next to the excel file and re-read from there until the excel file changes.
+    """
+    path = Path(path)
+    return _read_metadata_sheet(path, path.stat().st_mtime_ns)
+
+
+def get_metadata_df(path: Path = METADATA_FILE) -> pl.DataFrame:
+    return (
+        read_metadata(path)
+        .with_columns(pl.col(pl.Float64).round(4))
+        .with_columns(
+            pl.col("fertilization_time", "start_time_newport").str.to_datetime(
+                "%Y-%m-%d %H:%M:%S", time_zone="America/Los_Angeles", strict=False
+            )
         )
     )
-)
-DATA = pl.read_ipc("E:/dev-home/_readonly_datastore_/2025_HMSC/intermediate_outputs/source_cleaned_combined.arrow")
+
+
+@functools.cache
+def get_data_df(path: Path = DATA_FILE) -> pl.DataFrame:
+    return pl.read_ipc(path)
 
 
 class MetadataRow(TypedDict):
@@ -62,5 +97,22 @@ class MetadataRow(TypedDict):
     comment: str | None
 
 
+@functools.lru_cache
+def _metadata_rows(path: Path, mtime_ns: int) -> dict[str, MetadataRow]:
+    df = get_metadata_df(path)
+    duplicated = df.filter(pl.col("source_file_cleaned").is_duplicated()).get_column("source_file_cleaned")
+    if not duplicated.is_empty():
+        raise ValueError(f"duplicate metadata rows for: {', '.join(sorted(set(duplicated)))}")
+    return {row["source_file_cleaned"]: cast(MetadataRow, row) for row in df.iter_rows(named=True)}
+
+
+def get_metadata_rows(path: Path = METADATA_FILE) -> dict[str, MetadataRow]:
+    path = Path(path)
+    return _metadata_rows(path, path.stat().st_mtime_ns)
+
+
 def get_metadata(source: str) -> MetadataRow:
-    return cast(MetadataRow, METADATA.row(by_predicate=pl.col("source_file_cleaned") == source, named=True))
+    rows = get_metadata_rows()
+    if source not in rows:
+        raise ValueError(f"no metadata for: {source}")
+    return rows[source]
@@ -1,3 +1,5 @@
+import math
+
 import plotly.graph_objects as go
 import polars as pl
 from plotly.subplots import make_subplots
@@ -8,9 +10,15 @@ def plot_dataset(
     x_name: str,
     y_name: str,
     y2_name: str | None = None,
+    max_points: int = 5000,
 ) -> go.Figure:
     fig = make_subplots(specs=[[{"secondary_y": True}]])
 
+    # every point gets serialized to the browser, thin out long recordings to at most `max_points` first
+    # (`max_points <= 0` plots every point)
+    if max_points > 0:
+        df = df.gather_every(max(1, math.ceil(df.height / max_points)))
+
     x = df.get_column(x_name)
     y = df.get_column(y_name)
     y2 = df.get_column(y2_name) if y2_name is not None else None